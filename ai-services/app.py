@@ -1,14 +1,31 @@
+# Patch blocking stdlib I/O before anything imports socket/ssl/threading so
+# redis, sqlalchemy and requests cooperate with gunicorn's gevent workers.
+from gevent import monkey
+monkey.patch_all()
+
+from psycogreen.gevent import patch_psycopg
+patch_psycopg()
+
 import os
+import time
 import asyncio
+import threading
+from functools import wraps
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import (
+    JWTManager, create_access_token, jwt_required, get_jwt_identity, verify_jwt_in_request
+)
 import redis
+from redis.connection import BlockingConnectionPool
 import logging
-from datetime import timedelta
+from datetime import datetime, timedelta
+from decimal import Decimal
 import json
+import orjson
 
 from config.settings import Config
 from services.translation import TranslationService
@@ -23,23 +40,74 @@ from utils.helpers import error_handler, validate_request
 from utils.preprocessing import preprocess_text
 from utils.postprocessing import postprocess_response
 
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson
+
+    Decimal (Postgres NUMERIC) is written as a number, as in the orjson cache
+    payloads; other types fall back to Flask's default hook. Non-string dict
+    keys are stringified like the stdlib provider did.
+    """
+    
+    @staticmethod
+    def _default(obj):
+        if isinstance(obj, Decimal):
+            return float(obj)
+        return DefaultJSONProvider.default(obj)
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(
+            obj,
+            default=self._default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+        ).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.config.from_object(Config)
 
 # Initialize extensions
 CORS(app, origins=app.config['CORS_ORIGINS'])
 jwt = JWTManager(app)
 
-# Initialize rate limiter
+def rate_limit_key():
+    """Rate-limit per authenticated user, falling back to the client address"""
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+    return f"user:{identity}" if identity else get_remote_address()
+
+# Initialize rate limiter (Redis storage so limits are shared by all workers;
+# moving window avoids the 2x burst at fixed-window edges)
 limiter = Limiter(
-    app,
-    key_func=get_remote_address,
-    default_limits=["200 per day", "50 per hour"]
+    rate_limit_key,
+    app=app,
+    default_limits=["200 per day", "50 per hour"],
+    storage_uri=app.config['REDIS_URL'],
+    strategy="moving-window"
+)
+
+# Initialize Redis client (blocking pool so greenlets wait for a free
+# connection instead of opening unbounded sockets)
+redis_client = redis.Redis(
+    connection_pool=BlockingConnectionPool.from_url(
+        app.config['REDIS_URL'],
+        max_connections=int(os.environ.get('REDIS_MAX_CONNECTIONS', 100)),
+        timeout=5,
+        socket_connect_timeout=0.2,
+        socket_timeout=0.2,
+        health_check_interval=30
+    )
 )
 
-# Initialize Redis client
-redis_client = redis.Redis.from_url(app.config['REDIS_URL'])
+# Last successful Redis ping; /health reuses it for HEALTH_CACHE_SECONDS
+HEALTH_CACHE_SECONDS = 5
+_last_ok_ts = 0.0
 
 # Initialize services
 translation_service = TranslationService()
@@ -58,16 +126,86 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Atomic token bucket: refill by elapsed time, take one token, one round-trip
+token_bucket_script = redis_client.register_script("""
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'last_refill')
+local tokens = tonumber(bucket[1]) or capacity
+local last_refill = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - last_refill) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'last_refill', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) * 2)
+return allowed
+""")
+
+def token_bucket(capacity, per_seconds):
+    """Per-user token bucket limit; apply below @jwt_required() on a @limiter.exempt route"""
+    rate = capacity / per_seconds
+    
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            key = f"token_bucket:{request.endpoint}:{get_jwt_identity()}"
+            try:
+                allowed = token_bucket_script(keys=[key], args=[capacity, rate, time.time()])
+            except redis.RedisError as e:
+                # Fail open: a Redis outage should not take the endpoint down
+                logger.warning(f"Token bucket check failed: {str(e)}")
+                allowed = 1
+            
+            if not allowed:
+                return jsonify({
+                    'success': False,
+                    'error': 'Rate limit exceeded'
+                }), 429
+            
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Async services (SQLAlchemy async engine, redis.asyncio) bind pooled
+# connections to the event loop that opened them, so every request in a worker
+# must run on one long-lived loop instead of a fresh loop per call. The loop is
+# created lazily so it belongs to the worker process, not the gunicorn master.
+_event_loop = None
+_event_loop_pid = None
+_event_loop_lock = threading.Lock()
+
+def _get_event_loop():
+    global _event_loop, _event_loop_pid
+    with _event_loop_lock:
+        if _event_loop is None or _event_loop_pid != os.getpid():
+            _event_loop = asyncio.new_event_loop()
+            _event_loop_pid = os.getpid()
+            threading.Thread(target=_event_loop.run_forever, daemon=True).start()
+        return _event_loop
+
+def run_async(coro):
+    """Run a coroutine on the worker's event loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_event_loop()).result()
+
 @app.errorhandler(Exception)
 def handle_exception(e):
     return error_handler(e)
 
 @app.route('/health', methods=['GET'])
+@limiter.exempt
 def health_check():
     """Health check endpoint"""
+    global _last_ok_ts
     try:
-        # Check Redis connection
-        redis_client.ping()
+        # Check Redis connection (bounded by the client's socket timeouts)
+        if time.time() - _last_ok_ts >= HEALTH_CACHE_SECONDS:
+            redis_client.ping()
+            _last_ok_ts = time.time()
+        
         return jsonify({
             'status': 'healthy',
             'services': {
@@ -84,8 +222,9 @@ def health_check():
         }), 500
 
 @app.route('/api/translate', methods=['POST'])
-@limiter.limit("10 per minute")
+@limiter.exempt
 @jwt_required()
+@token_bucket(capacity=10, per_seconds=60)
 def translate_text():
     """Translate text to specified language"""
     try:
@@ -118,11 +257,11 @@ def get_recommendations():
         user_id = get_jwt_identity()
         data = validate_request(request.json, ['user_preferences'])
         
-        recommendations = recommendation_service.get_recommendations(
+        recommendations = run_async(recommendation_service.get_recommendations(
             user_id=user_id,
             preferences=data['user_preferences'],
             limit=data.get('limit', 10)
-        )
+        ))
         
         return jsonify({
             'success': True,
@@ -144,10 +283,10 @@ def analyze_sentiment():
     try:
         data = validate_request(request.json, ['text'])
         
-        sentiment = sentiment_service.analyze_sentiment(
+        sentiment = run_async(sentiment_service.analyze_sentiment(
             text=data['text'],
             include_entities=data.get('include_entities', False)
-        )
+        ))
         
         return jsonify({
             'success': True,
@@ -213,8 +352,9 @@ def analyze_content():
         }), 500
 
 @app.route('/api/chat', methods=['POST'])
-@limiter.limit("50 per minute")
+@limiter.exempt
 @jwt_required()
+@token_bucket(capacity=50, per_seconds=60)
 def chat_with_bot():
     """Chat with AI assistant"""
     try:
@@ -351,7 +491,10 @@ def summarize_content():
         }), 500
 
 if __name__ == '__main__':
-    port = int(os.environ.get('PORT', 5000))
-    debug = os.environ.get('FLASK_ENV') == 'development'
+    # Production is served by gunicorn with gevent workers (gunicorn.conf.py);
+    # the built-in server is only for local development.
+    if os.environ.get('FLASK_ENV') != 'development':
+        raise SystemExit("Run 'gunicorn -c gunicorn.conf.py app:app' outside development")
     
-    app.run(host='0.0.0.0', port=port, debug=debug)
+    port = int(os.environ.get('PORT', 5000))
+    app.run(host='0.0.0.0', port=port, debug=True)
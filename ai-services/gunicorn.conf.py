@@ -0,0 +1,36 @@
+import gc
+import multiprocessing
+import os
+
+# Endpoints are I/O-bound (Redis, Postgres, model services), so each worker
+# multiplexes many requests as gevent greenlets instead of blocking on one.
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gevent'
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Load app.py (and the ML models its services construct) once in the master;
+# forked workers share the weight pages copy-on-write instead of each loading
+# their own copy.
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+def pre_fork(server, worker):
+    # Move everything loaded so far out of the GC's tracked generations so
+    # collections in the workers don't write to (and un-share) those pages
+    gc.freeze()
+
+def post_fork(server, worker):
+    # Connections must never be shared across processes; drop any pooled in
+    # the master without closing the parent's sockets. Both services build an
+    # async engine in the preloaded master (AsyncEngine.dispose is a
+    # coroutine, so the sync engine's pool is reset directly)
+    import app as ai_app
+    for service in (ai_app.recommendation_service, ai_app.sentiment_service):
+        service.engine.sync_engine.dispose(close=False)
@@ -0,0 +1,138 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, List
+
+try:
+    from gevent import get_hub, monkey
+except ImportError:  # gevent is only needed under the gunicorn gevent workers
+    get_hub = monkey = None
+
+logger = logging.getLogger(__name__)
+
+def _gevent_patched() -> bool:
+    return monkey is not None and monkey.is_module_patched('threading')
+
+def call_in_native_thread(fn: Callable, *args) -> Any:
+    """Call fn on a real OS thread and return its result
+
+    Under gevent's monkey-patching ``threading.Thread`` is a greenlet on the
+    hub's OS thread, so CPU-bound work (forward passes, spaCy) would stall every
+    other greenlet in the worker. The hub threadpool runs it natively while only
+    the calling greenlet waits. Without gevent, fn simply runs inline.
+    """
+    if _gevent_patched():
+        return get_hub().threadpool.apply(fn, args)
+    return fn(*args)
+
+async def run_in_native_thread(fn: Callable, *args) -> Any:
+    """Await fn on a real OS thread without blocking the event loop"""
+    if not _gevent_patched():
+        return await asyncio.to_thread(fn, *args)
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def resolve(result):
+        if future.cancelled():
+            return
+        if result.successful():
+            future.set_result(result.value)
+        else:
+            future.set_exception(result.exception)
+
+    # rawlink callbacks run on the hub, which shares this loop's OS thread;
+    # call_soon_threadsafe wakes the loop out of its select
+    get_hub().threadpool.spawn(fn, *args).rawlink(
+        lambda result: loop.call_soon_threadsafe(resolve, result)
+    )
+    return await future
+
+def native_lock():
+    """A lock that blocks OS threads (gevent's patched Lock only blocks greenlets)"""
+    if _gevent_patched():
+        return monkey.get_original('_thread', 'allocate_lock')()
+    return threading.Lock()
+
+class BatchingQueue:
+    """Coalesce concurrent single-item calls into one batched call
+
+    Items submitted within ``max_wait_ms`` of the first queued item (up to
+    ``max_batch`` of them) are handed to ``batch_fn`` together, so a model runs
+    one padded forward pass instead of one pass per request. ``batch_fn`` must
+    return one result per input, in order, and runs on a native thread (see
+    ``call_in_native_thread``).
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch: int = 32,
+        max_wait_ms: float = 8
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+
+    def submit(self, item: Any) -> asyncio.Future:
+        """Queue an item; await the returned future for its result"""
+        self._ensure_worker()
+        future = concurrent.futures.Future()
+        self._queue.put((item, future))
+        return asyncio.wrap_future(future)
+
+    def _ensure_worker(self):
+        # Started lazily so each forked worker process gets its own thread
+        with self._lock:
+            if self._worker_pid != os.getpid():
+                # Anything queued before a fork belongs to the parent's callers
+                self._queue = queue.Queue()
+                self._worker = None
+                self._worker_pid = os.getpid()
+
+            if self._worker is None or not self._worker.is_alive():
+                # A replacement worker drains the same queue, so items already
+                # submitted are still answered
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+
+    def _collect_batch(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        # Drop requests whose caller has already gone away
+        return [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            try:
+                results = call_in_native_thread(self.batch_fn, items)
+                for (_, future), result in zip(batch, results, strict=True):
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Batched call failed for {len(items)} items: {str(e)}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
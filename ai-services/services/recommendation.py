@@ -1,33 +1,291 @@
 import numpy as np
-import pandas as pd
+from sklearn.base import clone
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+from scipy import sparse
 from sklearn.cluster import KMeans
-from sqlalchemy import create_engine, text
-import redis
-import json
+from sqlalchemy import text, JSON
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+import redis.asyncio as redis
+import orjson
+import re
+import hashlib
+import heapq
+import time
 import logging
 from datetime import datetime, timedelta
+from operator import itemgetter
+from decimal import Decimal
 from typing import List, Dict, Any, Optional
 import asyncio
 
 from config.settings import Config
 from utils.preprocessing import preprocess_text
 from utils.helpers import cache_result
+from services.batching import run_in_native_thread
+
+try:
+    from numba import njit
+except ImportError:  # Numba is optional; scoring falls back to NumPy
+    njit = None
 
 logger = logging.getLogger(__name__)
 
+# One Redis pool per process, shared by every service instance
+redis_pool = redis.ConnectionPool.from_url(
+    Config.REDIS_URL, 
+    max_connections=50, 
+    health_check_interval=30
+)
+
+# orjson handles datetimes and NumPy values natively; Postgres NUMERIC
+# aggregates arrive as Decimal and go through _orjson_default
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC
+
+def _orjson_default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def _dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_orjson_default, option=ORJSON_OPTIONS)
+
+LEVEL_MAPPING = {"beginner": 1, "intermediate": 2, "advanced": 3}
+
+# Fitted TF-IDF course index: refreshed hourly, blended into course scores
+COURSE_INDEX_TTL = 3600
+CONTENT_SIMILARITY_WEIGHT = 0.3
+
+# Queries are built once at import so their compiled form is reused across calls.
+
+# Assessment scores are averaged per enrolled course (via the assessment's
+# course) before grouping, so they don't fan out across every enrollment row.
+# Interests, preferred categories and skill level are derived in the same
+# statement from the learning/trading aggregates.
+USER_PROFILE_QUERY = text("""
+    WITH learning AS (
+        SELECT c.category, c.level, COUNT(*) as completed_courses,
+               AVG(cs.avg_percentage) as avg_score
+        FROM enrollments e
+        JOIN courses c ON e.course_id = c.id
+        LEFT JOIN LATERAL (
+            SELECT AVG(ar.percentage) as avg_percentage
+            FROM assessment_results ar
+            JOIN assessments a ON a.id = ar.assessment_id
+            WHERE ar.user_id = e.user_id AND a.course_id = c.id
+        ) cs ON TRUE
+        WHERE e.user_id = :user_id AND e.completed_at IS NOT NULL
+        GROUP BY c.category, c.level
+    ),
+    trading AS (
+        SELECT symbol, COUNT(*) as trade_count, 
+               AVG(executed_price * quantity) as avg_trade_size,
+               SUM(CASE WHEN type = 'BUY' THEN 1 ELSE 0 END) as buy_count,
+               SUM(CASE WHEN type = 'SELL' THEN 1 ELSE 0 END) as sell_count
+        FROM trades
+        WHERE user_id = :user_id AND status = 'EXECUTED'
+        GROUP BY symbol
+        ORDER BY trade_count DESC
+        LIMIT 20
+    )
+    SELECT
+        (SELECT row_to_json(ud) FROM (
+            SELECT u.*, up.preferences, up.risk_profile, up.investment_experience
+            FROM users u
+            LEFT JOIN user_preferences up ON u.id = up.user_id
+            WHERE u.id = :user_id
+        ) ud) as user_data,
+        COALESCE((SELECT json_agg(l) FROM learning l), '[]'::json) as learning_progress,
+        COALESCE((SELECT json_agg(t) FROM trading t), '[]'::json) as trading_behavior,
+        ARRAY(
+            SELECT category FROM learning
+            UNION
+            -- Sector from symbol (simplified); add more mappings as needed
+            SELECT CASE
+                       WHEN symbol LIKE 'BANK%' THEN 'banking'
+                       WHEN symbol LIKE 'IT%' THEN 'technology'
+                   END as sector
+            FROM trading
+            WHERE symbol LIKE 'BANK%' OR symbol LIKE 'IT%'
+        ) as interests,
+        ARRAY(
+            SELECT category FROM learning ORDER BY completed_courses DESC LIMIT 3
+        ) as preferred_categories,
+        (SELECT CASE
+                    WHEN SUM(completed_courses) >= 10 AND AVG(avg_score) >= 80 THEN 'advanced'
+                    WHEN SUM(completed_courses) >= 5 AND AVG(avg_score) >= 70 THEN 'intermediate'
+                    ELSE 'beginner'
+                END
+         FROM learning) as skill_level
+""").columns(user_data=JSON, learning_progress=JSON, trading_behavior=JSON)
+
+CANDIDATE_COURSES_QUERY = text("""
+    SELECT c.*, AVG(cr.rating) as avg_rating, COUNT(cr.id) as review_count
+    FROM courses c
+    LEFT JOIN course_reviews cr ON c.id = cr.course_id
+    WHERE c.status = 'PUBLISHED' AND c.id NOT IN (
+        SELECT course_id FROM enrollments 
+        WHERE user_id = :user_id AND completed_at IS NOT NULL
+    )
+    GROUP BY c.id
+""")
+
+RECENT_NEWS_QUERY = text("""
+    SELECT * FROM news
+    WHERE published_at >= :since_date
+    ORDER BY published_at DESC
+    LIMIT 100
+""")
+
+COURSE_CORPUS_QUERY = text("""
+    SELECT id, title || ' ' || COALESCE(description, '') as document
+    FROM courses
+    WHERE status = 'PUBLISHED'
+    ORDER BY id
+""")
+
+# One row per enrollment: lesson time and assessment scores are aggregated for
+# that enrollment's course only (previously joined on user alone, E x L x A rows).
+LEARNING_HISTORY_QUERY = text("""
+    SELECT c.id, c.title, c.category, c.level, e.completed_at,
+           lp.time_spent, ar.score
+    FROM enrollments e
+    JOIN courses c ON e.course_id = c.id
+    LEFT JOIN LATERAL (
+        SELECT SUM(lp.time_spent) as time_spent
+        FROM learning_progress lp
+        JOIN lessons l ON l.id = lp.lesson_id
+        WHERE lp.user_id = e.user_id AND l.course_id = c.id
+    ) lp ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT AVG(ar.percentage) as score
+        FROM assessment_results ar
+        JOIN assessments a ON a.id = ar.assessment_id
+        WHERE ar.user_id = e.user_id AND a.course_id = c.id
+    ) ar ON TRUE
+    WHERE e.user_id = :user_id
+    ORDER BY e.completed_at DESC
+    LIMIT 50
+""")
+
+# Elapsed value for a missing timestamp: larger than any recency cutoff, so it
+# earns no bonus, while future timestamps (negative elapsed) still do
+MISSING_ELAPSED = np.iinfo(np.int32).max
+
+def _elapsed(
+    timestamps: List[Optional[datetime]], 
+    now: np.datetime64, 
+    unit: str
+) -> np.ndarray:
+    """Whole units (e.g. 'D', 'h') elapsed since each timestamp, floored like
+    timedelta.days; MISSING_ELAPSED where missing"""
+    values = np.array(
+        [ts if ts is not None else "NaT" for ts in timestamps], dtype="datetime64[s]"
+    )
+    elapsed = (now - values).astype(f"timedelta64[{unit}]")
+    return np.where(np.isnat(values), MISSING_ELAPSED, elapsed.astype(np.int64)).astype(np.int32)
+
+def _score_courses_kernel(
+    is_preferred: np.ndarray,
+    level: np.ndarray,
+    rating: np.ndarray,
+    review_count: np.ndarray,
+    days_old: np.ndarray,
+    language_match: np.ndarray,
+    user_level: int
+) -> np.ndarray:
+    """Score candidate courses row by row (compiled by Numba)"""
+    n = level.shape[0]
+    scores = np.zeros(n, dtype=np.float32)
+    
+    for i in range(n):
+        score = 0.0
+        
+        if is_preferred[i]:
+            score += 0.3
+        
+        if level[i] == user_level:
+            score += 0.25
+        elif level[i] == user_level + 1:
+            score += 0.15
+        elif level[i] == user_level - 1:
+            score += 0.1
+        
+        score += (rating[i] / 5.0) * 0.2
+        score += min(review_count[i] / 100.0, 0.1)
+        
+        # days_old is MISSING_ELAPSED when the course has no creation date
+        if days_old[i] < 30:
+            score += 0.1
+        elif days_old[i] < 90:
+            score += 0.05
+        
+        if language_match[i]:
+            score += 0.1
+        
+        scores[i] = min(score, 1.0)
+    
+    return scores
+
+def _score_courses_vectorized(
+    is_preferred: np.ndarray,
+    level: np.ndarray,
+    rating: np.ndarray,
+    review_count: np.ndarray,
+    days_old: np.ndarray,
+    language_match: np.ndarray,
+    user_level: int
+) -> np.ndarray:
+    """Score candidate courses with NumPy column arithmetic (no JIT required)"""
+    scores = np.zeros(level.shape[0], dtype=np.float32)
+    
+    scores += 0.3 * is_preferred
+    
+    diff = level.astype(np.int16) - user_level
+    scores += np.where(diff == 0, 0.25, np.where(diff == 1, 0.15, np.where(diff == -1, 0.1, 0.0)))
+    
+    scores += (rating / 5.0) * 0.2
+    scores += np.minimum(review_count / 100.0, 0.1)
+    
+    # days_old is MISSING_ELAPSED when the course has no creation date
+    scores += np.where(days_old < 30, 0.1, np.where(days_old < 90, 0.05, 0.0))
+    
+    scores += 0.1 * language_match
+    
+    return np.minimum(scores, 1.0)
+
+# cache=True stores the compiled kernel on disk so workers don't recompile on boot
+score_courses = (
+    njit(cache=True, fastmath=True)(_score_courses_kernel)
+    if njit is not None else _score_courses_vectorized
+)
+
 class RecommendationService:
+    # Per-process course index shared by all instances (see _get_course_index)
+    _course_index: Optional[Dict[str, Any]] = None
+    # Serializes refreshes so an expired index is refit once, not per request
+    _course_index_lock = asyncio.Lock()
+    
     def __init__(self):
-        self.engine = create_engine(Config.DATABASE_URL)
-        self.redis_client = redis.Redis.from_url(Config.REDIS_URL)
+        # asyncpg prepares statements server-side and caches them per connection,
+        # so the module-level queries below are parsed and planned once
+        self.engine = create_async_engine(
+            make_url(Config.DATABASE_URL)
+            .set(drivername="postgresql+asyncpg")
+            .update_query_dict({"prepared_statement_cache_size": "500"}),
+            pool_size=20,
+            max_overflow=10,
+            pool_pre_ping=True,
+            pool_recycle=1800
+        )
+        self.redis_client = redis.Redis(connection_pool=redis_pool)
         self.vectorizer = TfidfVectorizer(
             max_features=1000,
             stop_words='english',
             ngram_range=(1, 2)
         )
         self.user_profiles = {}
-        self.course_features = {}
         
     async def get_recommendations(
         self, 
@@ -37,18 +295,32 @@ class RecommendationService:
     ) -> List[Dict[str, Any]]:
         """Get personalized content recommendations for user"""
         try:
-            # Get user profile and history
-            user_profile = await self._get_user_profile(user_id)
-            learning_history = await self._get_learning_history(user_id)
+            # Serve repeated requests with identical preferences from cache; the
+            # cached profile is fetched in the same round-trip for the miss path
+            cache_key = self._recommendations_cache_key(user_id, preferences, limit)
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.get(cache_key).get(f"user_profile:{user_id}")
+                cached_recommendations, cached_profile = await pipe.execute()
             
-            # Generate different types of recommendations
-            course_recommendations = await self._recommend_courses(
-                user_profile, learning_history, preferences, limit // 2
-            )
+            if cached_recommendations:
+                return orjson.loads(cached_recommendations)
             
-            news_recommendations = await self._recommend_news(
-                user_profile, preferences, limit // 2
-            )
+            # All reads share one pooled connection and, under REPEATABLE READ,
+            # one snapshot of the user's profile, history and candidate courses
+            async with self.engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="REPEATABLE READ")
+                
+                # Get user profile and history
+                user_profile = await self._get_user_profile(conn, user_id, cached_profile)
+                learning_history = await self._get_learning_history(conn, user_id)
+                
+                # Generate different types of recommendations
+                course_recommendations = await self._recommend_courses(
+                    conn, user_profile, learning_history, preferences, limit // 2
+                )
+                news_recommendations = await self._recommend_news(
+                    conn, user_profile, preferences, limit // 2
+                )
             
             # Combine and rank recommendations
             all_recommendations = course_recommendations + news_recommendations
@@ -56,9 +328,13 @@ class RecommendationService:
                 all_recommendations, user_profile, limit
             )
             
-            # Cache results
-            cache_key = f"recommendations:{user_id}"
-            await self._cache_recommendations(cache_key, ranked_recommendations)
+            # Cache results (and the profile, if it was rebuilt)
+            await self._cache_recommendations(
+                user_id, 
+                cache_key, 
+                ranked_recommendations, 
+                user_profile=None if cached_profile else user_profile
+            )
             
             return ranked_recommendations
             
@@ -66,66 +342,34 @@ class RecommendationService:
             logger.error(f"Error generating recommendations for user {user_id}: {str(e)}")
             raise
 
-    async def _get_user_profile(self, user_id: str) -> Dict[str, Any]:
-        """Get comprehensive user profile"""
-        cache_key = f"user_profile:{user_id}"
-        cached_profile = self.redis_client.get(cache_key)
-        
+    async def _get_user_profile(
+        self, 
+        conn: AsyncConnection, 
+        user_id: str, 
+        cached_profile: Optional[bytes] = None
+    ) -> Dict[str, Any]:
+        """Get comprehensive user profile (cached by _cache_recommendations)"""
         if cached_profile:
-            return json.loads(cached_profile)
-        
-        with self.engine.connect() as conn:
-            # Get user basic info
-            user_query = text("""
-                SELECT u.*, up.preferences, up.risk_profile, up.investment_experience
-                FROM users u
-                LEFT JOIN user_preferences up ON u.id = up.user_id
-                WHERE u.id = :user_id
-            """)
-            user_data = conn.execute(user_query, {"user_id": user_id}).fetchone()
-            
-            # Get learning progress
-            learning_query = text("""
-                SELECT c.category, c.level, COUNT(*) as completed_courses,
-                       AVG(ar.percentage) as avg_score
-                FROM enrollments e
-                JOIN courses c ON e.course_id = c.id
-                LEFT JOIN assessment_results ar ON ar.user_id = e.user_id
-                WHERE e.user_id = :user_id AND e.completed_at IS NOT NULL
-                GROUP BY c.category, c.level
-            """)
-            learning_data = conn.execute(learning_query, {"user_id": user_id}).fetchall()
-            
-            # Get trading behavior
-            trading_query = text("""
-                SELECT symbol, COUNT(*) as trade_count, 
-                       AVG(executed_price * quantity) as avg_trade_size,
-                       SUM(CASE WHEN type = 'BUY' THEN 1 ELSE 0 END) as buy_count,
-                       SUM(CASE WHEN type = 'SELL' THEN 1 ELSE 0 END) as sell_count
-                FROM trades
-                WHERE user_id = :user_id AND status = 'EXECUTED'
-                GROUP BY symbol
-                ORDER BY trade_count DESC
-                LIMIT 20
-            """)
-            trading_data = conn.execute(trading_query, {"user_id": user_id}).fetchall()
-            
-            profile = {
-                "user_data": dict(user_data) if user_data else {},
-                "learning_progress": [dict(row) for row in learning_data],
-                "trading_behavior": [dict(row) for row in trading_data],
-                "interests": self._extract_interests(learning_data, trading_data),
-                "skill_level": self._determine_skill_level(learning_data),
-                "risk_profile": user_data.risk_profile if user_data else "moderate",
-                "preferred_categories": self._get_preferred_categories(learning_data)
-            }
-            
-            # Cache for 1 hour
-            self.redis_client.setex(cache_key, 3600, json.dumps(profile))
-            return profile
+            return orjson.loads(cached_profile)
+        
+        # User info, learning progress and trading behavior in one round-trip
+        row = (await conn.execute(USER_PROFILE_QUERY, {"user_id": user_id})).one()
+        
+        user_data = row.user_data
+        
+        return {
+            "user_data": user_data or {},
+            "learning_progress": row.learning_progress,
+            "trading_behavior": row.trading_behavior,
+            "interests": row.interests,
+            "skill_level": row.skill_level,
+            "risk_profile": user_data["risk_profile"] if user_data else "moderate",
+            "preferred_categories": row.preferred_categories
+        }
 
     async def _recommend_courses(
         self, 
+        conn: AsyncConnection, 
         user_profile: Dict[str, Any], 
         learning_history: List[Dict[str, Any]], 
         preferences: Dict[str, Any], 
@@ -133,30 +377,40 @@ class RecommendationService:
     ) -> List[Dict[str, Any]]:
         """Recommend courses based on user profile and learning history"""
         
-        with self.engine.connect() as conn:
-            # Get available courses
-            courses_query = text("""
-                SELECT c.*, AVG(cr.rating) as avg_rating, COUNT(cr.id) as review_count
-                FROM courses c
-                LEFT JOIN course_reviews cr ON c.id = cr.course_id
-                WHERE c.status = 'PUBLISHED' AND c.id NOT IN (
-                    SELECT course_id FROM enrollments 
-                    WHERE user_id = :user_id AND completed_at IS NOT NULL
-                )
-                GROUP BY c.id
-            """)
-            courses = conn.execute(courses_query, {"user_id": user_profile["user_data"]["id"]}).fetchall()
-        
-        # Convert to DataFrame for easier processing
-        df_courses = pd.DataFrame([dict(course) for course in courses])
+        # Get available courses
+        result = await conn.execute(
+            CANDIDATE_COURSES_QUERY, {"user_id": user_profile["user_data"]["id"]}
+        )
+        courses = [dict(row) for row in result.mappings()]
         
-        if df_courses.empty:
+        if not courses:
             return []
         
         # Calculate course scores
+        scores = score_courses(
+            *self._course_score_inputs(courses, user_profile, preferences)
+        )
+        
+        # Blend in content similarity between the user's interests and courses
+        similarity = self._content_similarity(
+            await self._get_course_index(), [course["id"] for course in courses], user_profile
+        )
+        if similarity is not None:
+            scores = (
+                (1 - CONTENT_SIMILARITY_WEIGHT) * scores
+                + CONTENT_SIMILARITY_WEIGHT * similarity
+            ).astype(np.float32)
+        
+        # Select the top results in O(N), then order just those
+        if limit < len(scores):
+            top = np.argpartition(-scores, limit)[:limit]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        
         course_scores = []
-        for _, course in df_courses.iterrows():
-            score = self._calculate_course_score(course, user_profile, preferences)
+        for i in top:
+            course = courses[i]
             course_scores.append({
                 "item_id": course["id"],
                 "item_type": "course",
@@ -164,43 +418,73 @@ class RecommendationService:
                 "description": course["description"],
                 "category": course["category"],
                 "level": course["level"],
-                "rating": course["avg_rating"] or 0,
-                "score": score,
+                "rating": float(course["avg_rating"] or 0),
+                "score": float(scores[i]),
                 "reason": self._get_recommendation_reason(course, user_profile)
             })
         
-        # Sort by score and return top results
-        course_scores.sort(key=lambda x: x["score"], reverse=True)
-        return course_scores[:limit]
+        return course_scores
+
+    def _course_score_inputs(
+        self, 
+        courses: List[Dict[str, Any]], 
+        user_profile: Dict[str, Any], 
+        preferences: Dict[str, Any]
+    ) -> tuple:
+        """Build the numeric column arrays consumed by score_courses"""
+        n = len(courses)
+        preferred_categories = set(user_profile.get("preferred_categories", []))
+        preferred_language = preferences.get("preferred_language")
+        user_level = LEVEL_MAPPING.get(user_profile.get("skill_level", "beginner"), 1)
+        now = np.datetime64("now")
+        
+        return (
+            np.fromiter(
+                (course["category"] in preferred_categories for course in courses), np.bool_, n
+            ),
+            np.fromiter(
+                (LEVEL_MAPPING.get(course["level"], 1) for course in courses), np.int8, n
+            ),
+            np.fromiter(
+                (float(course["avg_rating"] or 0) for course in courses), np.float32, n
+            ),
+            np.fromiter(
+                (float(course["review_count"] or 0) for course in courses), np.float32, n
+            ),
+            _elapsed([course["created_at"] for course in courses], now, "D"),
+            np.fromiter(
+                (course.get("language") == preferred_language for course in courses), np.bool_, n
+            ),
+            user_level
+        )
 
     async def _recommend_news(
         self, 
+        conn: AsyncConnection, 
         user_profile: Dict[str, Any], 
         preferences: Dict[str, Any], 
         limit: int
     ) -> List[Dict[str, Any]]:
         """Recommend news articles based on user interests"""
         
-        with self.engine.connect() as conn:
-            # Get recent news
-            news_query = text("""
-                SELECT * FROM news
-                WHERE published_at >= :since_date
-                ORDER BY published_at DESC
-                LIMIT 100
-            """)
-            since_date = datetime.now() - timedelta(days=7)
-            news_articles = conn.execute(news_query, {"since_date": since_date}).fetchall()
+        # Get recent news
+        since_date = datetime.now() - timedelta(days=7)
+        news_articles = (await conn.execute(RECENT_NEWS_QUERY, {"since_date": since_date})).fetchall()
         
         if not news_articles:
             return []
         
         # Calculate news scores
         news_scores = []
-        user_interests = user_profile.get("interests", [])
+        interest_pattern = self._compile_interest_pattern(user_profile.get("interests", []))
+        hours_old = _elapsed(
+            [article.published_at for article in news_articles], np.datetime64("now"), "h"
+        )
         
-        for article in news_articles:
-            score = self._calculate_news_score(dict(article), user_interests)
+        for article, article_hours_old in zip(news_articles, hours_old):
+            score = self._calculate_news_score(
+                dict(article._mapping), interest_pattern, article_hours_old
+            )
             news_scores.append({
                 "item_id": article.id,
                 "item_type": "news",
@@ -213,70 +497,160 @@ class RecommendationService:
                 "reason": "Based on your trading activity and interests"
             })
         
-        # Sort by score and return top results
-        news_scores.sort(key=lambda x: x["score"], reverse=True)
-        return news_scores[:limit]
+        # Return top results without sorting the tail
+        return heapq.nlargest(limit, news_scores, key=itemgetter("score"))
 
-    def _calculate_course_score(
+    async def _get_course_index(self) -> Optional[Dict[str, Any]]:
+        """Get the TF-IDF course index, refreshing it once it is older than an hour"""
+        index = RecommendationService._course_index
+        if index and time.monotonic() - index["loaded_at"] < COURSE_INDEX_TTL:
+            return index
+        
+        async with RecommendationService._course_index_lock:
+            # Another request may have refreshed it while this one waited
+            index = RecommendationService._course_index
+            if index and time.monotonic() - index["loaded_at"] < COURSE_INDEX_TTL:
+                return index
+            
+            try:
+                return await self.refresh_course_index()
+            except Exception as e:
+                logger.error(f"Error refreshing course index: {str(e)}")
+                return index
+    
+    async def refresh_course_index(self) -> Optional[Dict[str, Any]]:
+        """Fit the TF-IDF vectorizer on published courses and share it via Redis"""
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(COURSE_CORPUS_QUERY)).fetchall()
+        
+        if not rows:
+            return None
+        
+        course_ids = [row.id for row in rows]
+        documents = [row.document for row in rows]
+        content_hash = hashlib.blake2b(
+            _dumps([course_ids, documents]), digest_size=16
+        ).hexdigest()
+        
+        index = RecommendationService._course_index
+        if index and index["hash"] == content_hash:
+            index["loaded_at"] = time.monotonic()
+            return index
+        
+        # Workers share one fit per catalog version through Redis
+        cache_key = f"course_index:{content_hash}"
+        cached_index = await self.redis_client.hgetall(cache_key)
+        
+        if cached_index:
+            vectorizer, course_matrix = self._load_course_index(cached_index)
+        else:
+            vectorizer = clone(self.vectorizer)
+            course_matrix = await run_in_native_thread(vectorizer.fit_transform, documents)
+            # Unit-length rows make a plain sparse dot product the cosine similarity
+            course_matrix = normalize(course_matrix, norm="l2", axis=1).tocsr()
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.hset(cache_key, mapping=self._dump_course_index(vectorizer, course_matrix))
+                pipe.expire(cache_key, COURSE_INDEX_TTL * 2)
+                await pipe.execute()
+        
+        index = {
+            "hash": content_hash,
+            "vectorizer": vectorizer,
+            "matrix": course_matrix,
+            "id_to_row": {course_id: row for row, course_id in enumerate(course_ids)},
+            "loaded_at": time.monotonic()
+        }
+        RecommendationService._course_index = index
+        return index
+    
+    def _dump_course_index(
         self, 
-        course: pd.Series, 
-        user_profile: Dict[str, Any], 
-        preferences: Dict[str, Any]
-    ) -> float:
-        """Calculate recommendation score for a course"""
-        score = 0.0
-        
-        # Category preference
-        preferred_categories = user_profile.get("preferred_categories", [])
-        if course["category"] in preferred_categories:
-            score += 0.3
-        
-        # Level appropriateness
-        user_skill_level = user_profile.get("skill_level", "beginner")
-        level_mapping = {"beginner": 1, "intermediate": 2, "advanced": 3}
-        user_level = level_mapping.get(user_skill_level, 1)
-        course_level = level_mapping.get(course["level"], 1)
-        
-        if course_level == user_level:
-            score += 0.25
-        elif course_level == user_level + 1:
-            score += 0.15
-        elif course_level == user_level - 1:
-            score += 0.1
-        
-        # Rating and popularity
-        rating = course["avg_rating"] or 0
-        review_count = course["review_count"] or 0
-        score += (rating / 5.0) * 0.2
-        score += min(review_count / 100.0, 0.1)  # Popularity bonus
-        
-        # Recency
-        if course["created_at"]:
-            days_old = (datetime.now() - course["created_at"]).days
-            if days_old < 30:
-                score += 0.1
-            elif days_old < 90:
-                score += 0.05
-        
-        # Personal preferences
-        if preferences.get("preferred_language") == course.get("language"):
-            score += 0.1
-        
-        return min(score, 1.0)
+        vectorizer: TfidfVectorizer, 
+        course_matrix: sparse.csr_matrix
+    ) -> Dict[str, bytes]:
+        """Encode a fitted index as JSON metadata plus raw array bytes (no pickle)"""
+        meta = {
+            "vocabulary": vectorizer.vocabulary_,
+            "shape": course_matrix.shape,
+            "dtypes": [
+                course_matrix.data.dtype.str, 
+                course_matrix.indices.dtype.str, 
+                course_matrix.indptr.dtype.str
+            ]
+        }
+        return {
+            "meta": orjson.dumps(meta, option=orjson.OPT_SERIALIZE_NUMPY),
+            "idf": vectorizer.idf_.astype(np.float64).tobytes(),
+            "data": course_matrix.data.tobytes(),
+            "indices": course_matrix.indices.tobytes(),
+            "indptr": course_matrix.indptr.tobytes()
+        }
+
+    def _load_course_index(self, fields: Dict[bytes, bytes]) -> tuple:
+        """Rebuild the vectorizer and matrix written by _dump_course_index"""
+        meta = orjson.loads(fields[b"meta"])
+        data_dtype, indices_dtype, indptr_dtype = meta["dtypes"]
+        
+        vectorizer = clone(self.vectorizer)
+        vectorizer.vocabulary_ = meta["vocabulary"]
+        vectorizer.idf_ = np.frombuffer(fields[b"idf"], dtype=np.float64)
+        
+        course_matrix = sparse.csr_matrix(
+            (
+                np.frombuffer(fields[b"data"], dtype=data_dtype),
+                np.frombuffer(fields[b"indices"], dtype=indices_dtype),
+                np.frombuffer(fields[b"indptr"], dtype=indptr_dtype)
+            ),
+            shape=tuple(meta["shape"])
+        )
+        return vectorizer, course_matrix
+
+    def _content_similarity(
+        self, 
+        index: Optional[Dict[str, Any]], 
+        course_ids: List[str], 
+        user_profile: Dict[str, Any]
+    ) -> Optional[np.ndarray]:
+        """Cosine similarity of each candidate course to the user's interests"""
+        terms = user_profile.get("interests", []) + user_profile.get("preferred_categories", [])
+        if not index or not terms:
+            return None
+        
+        user_vector = normalize(index["vectorizer"].transform([" ".join(terms)]), norm="l2")
+        
+        # Courses published after the last refresh have no row yet
+        rows = np.array([index["id_to_row"].get(course_id, -1) for course_id in course_ids])
+        indexed = rows >= 0
+        
+        # One sparse matrix-vector product over the candidate rows only, instead
+        # of cosine_similarity's dense pairwise output for the whole catalog
+        similarity = np.zeros(len(rows), dtype=np.float32)
+        similarity[indexed] = (index["matrix"][rows[indexed]] @ user_vector.T).toarray().ravel()
+        return similarity
+
+    def _compile_interest_pattern(self, user_interests: List[str]) -> Optional[re.Pattern]:
+        """Single alternation over all interests, so each article is scanned once"""
+        if not user_interests:
+            return None
+        
+        # Longest first so an interest is not shadowed by one of its prefixes
+        interests = sorted({interest.lower() for interest in user_interests}, key=len, reverse=True)
+        return re.compile("|".join(map(re.escape, interests)), re.IGNORECASE)
 
     def _calculate_news_score(
         self, 
         article: Dict[str, Any], 
-        user_interests: List[str]
+        interest_pattern: Optional[re.Pattern], 
+        hours_old: int
     ) -> float:
         """Calculate recommendation score for a news article"""
         score = 0.0
         
-        # Interest matching
-        article_text = f"{article['title']} {article['summary']}".lower()
-        for interest in user_interests:
-            if interest.lower() in article_text:
-                score += 0.3
+        # Interest matching (each distinct interest found counts once)
+        if interest_pattern is not None:
+            article_text = f"{article['title']} {article['summary']}"
+            matched = {match.lower() for match in interest_pattern.findall(article_text)}
+            score += 0.3 * len(matched)
         
         # Category relevance
         if article["category"] in ["stocks", "mutual_funds", "trading", "investment"]:
@@ -288,13 +662,11 @@ class RecommendationService:
         elif article.get("sentiment") == "neutral":
             score += 0.05
         
-        # Recency
-        if article.get("published_at"):
-            hours_old = (datetime.now() - article["published_at"]).total_seconds() / 3600
-            if hours_old < 24:
-                score += 0.2
-            elif hours_old < 72:
-                score += 0.1
+        # Recency (hours_old is MISSING_ELAPSED when the article has no publish date)
+        if hours_old < 24:
+            score += 0.2
+        elif hours_old < 72:
+            score += 0.1
         
         return min(score, 1.0)
 
@@ -305,8 +677,9 @@ class RecommendationService:
         limit: int
     ) -> List[Dict[str, Any]]:
         """Final ranking of all recommendations"""
-        # Sort by score
-        ranked = sorted(recommendations, key=lambda x: x["score"], reverse=True)
+        # Candidates by score; the diversity cap below only ever needs the head
+        # (each sub-recommender contributes at most limit // 2 items)
+        ranked = heapq.nlargest(limit * 2, recommendations, key=itemgetter("score"))
         
         # Ensure diversity (no more than 60% of one type)
         final_recommendations = []
@@ -323,62 +696,9 @@ class RecommendationService:
         
         return final_recommendations
 
-    def _extract_interests(
-        self, 
-        learning_data: List[Dict[str, Any]], 
-        trading_data: List[Dict[str, Any]]
-    ) -> List[str]:
-        """Extract user interests from learning and trading data"""
-        interests = set()
-        
-        # From learning data
-        for item in learning_data:
-            interests.add(item["category"])
-        
-        # From trading data
-        for trade in trading_data:
-            # Extract sector/industry from symbol (simplified)
-            symbol = trade["symbol"]
-            if symbol.startswith("BANK"):
-                interests.add("banking")
-            elif symbol.startswith("IT"):
-                interests.add("technology")
-            # Add more sector mappings as needed
-        
-        return list(interests)
-
-    def _determine_skill_level(self, learning_data: List[Dict[str, Any]]) -> str:
-        """Determine user's skill level based on learning progress"""
-        if not learning_data:
-            return "beginner"
-        
-        total_courses = sum(item["completed_courses"] for item in learning_data)
-        avg_score = np.mean([item["avg_score"] for item in learning_data if item["avg_score"]])
-        
-        if total_courses >= 10 and avg_score >= 80:
-            return "advanced"
-        elif total_courses >= 5 and avg_score >= 70:
-            return "intermediate"
-        else:
-            return "beginner"
-
-    def _get_preferred_categories(self, learning_data: List[Dict[str, Any]]) -> List[str]:
-        """Get user's preferred learning categories"""
-        if not learning_data:
-            return []
-        
-        # Sort by number of completed courses
-        sorted_categories = sorted(
-            learning_data, 
-            key=lambda x: x["completed_courses"], 
-            reverse=True
-        )
-        
-        return [item["category"] for item in sorted_categories[:3]]
-
     def _get_recommendation_reason(
         self, 
-        course: pd.Series, 
+        course: Dict[str, Any], 
         user_profile: Dict[str, Any]
     ) -> str:
         """Generate explanation for why this course is recommended"""
@@ -398,39 +718,59 @@ class RecommendationService:
         
         return "Recommended because it " + " and ".join(reasons)
 
+    def _recommendations_cache_key(
+        self, 
+        user_id: str, 
+        preferences: Dict[str, Any], 
+        limit: int
+    ) -> str:
+        """Cache key for a user's recommendations under the given preferences"""
+        preferences_hash = hashlib.blake2b(
+            orjson.dumps(
+                preferences, default=_orjson_default, option=ORJSON_OPTIONS | orjson.OPT_SORT_KEYS
+            ), 
+            digest_size=8
+        ).hexdigest()
+        return f"recommendations:{user_id}:{preferences_hash}:{limit}"
+
     async def _cache_recommendations(
         self, 
+        user_id: str, 
         cache_key: str, 
-        recommendations: List[Dict[str, Any]]
+        recommendations: List[Dict[str, Any]], 
+        user_profile: Optional[Dict[str, Any]] = None
     ):
-        """Cache recommendations for faster access"""
+        """Cache recommendations (and a freshly built profile) in one round-trip"""
         try:
-            self.redis_client.setex(
-                cache_key, 
-                1800,  # 30 minutes
-                json.dumps(recommendations, default=str)
-            )
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.setex(
+                    cache_key, 
+                    1800,  # 30 minutes
+                    _dumps(recommendations)
+                )
+                
+                # Track live keys so feedback can invalidate every preference variant
+                keys_key = f"rec_keys:{user_id}"
+                pipe.sadd(keys_key, cache_key)
+                pipe.expire(keys_key, 1800)
+                
+                if user_profile is not None:
+                    pipe.setex(f"user_profile:{user_id}", 3600, _dumps(user_profile))  # 1 hour
+                
+                await pipe.execute()
         except Exception as e:
             logger.error(f"Error caching recommendations: {str(e)}")
 
-    async def _get_learning_history(self, user_id: str) -> List[Dict[str, Any]]:
+    async def _get_learning_history(
+        self, 
+        conn: AsyncConnection, 
+        user_id: str
+    ) -> List[Dict[str, Any]]:
         """Get user's learning history"""
-        with self.engine.connect() as conn:
-            query = text("""
-                SELECT c.id, c.title, c.category, c.level, e.completed_at,
-                       lp.time_spent, ar.percentage as score
-                FROM enrollments e
-                JOIN courses c ON e.course_id = c.id
-                LEFT JOIN learning_progress lp ON lp.user_id = e.user_id
-                LEFT JOIN assessment_results ar ON ar.user_id = e.user_id
-                WHERE e.user_id = :user_id
-                ORDER BY e.completed_at DESC
-                LIMIT 50
-            """)
-            result = conn.execute(query, {"user_id": user_id}).fetchall()
-            return [dict(row) for row in result]
-
-    def update_user_feedback(
+        result = await conn.execute(LEARNING_HISTORY_QUERY, {"user_id": user_id})
+        return [dict(row) for row in result.mappings()]
+
+    async def update_user_feedback(
         self, 
         user_id: str, 
         item_id: str, 
@@ -447,17 +787,22 @@ class RecommendationService:
                 "timestamp": datetime.now()
             }
             
-            # Store feedback in Redis for real-time updates
+            # Store feedback in Redis for real-time updates, fetching the
+            # user's cached recommendation keys in the same round-trip
             feedback_key = f"feedback:{user_id}:{item_id}"
-            self.redis_client.setex(
-                feedback_key, 
-                86400,  # 24 hours
-                json.dumps(feedback_data, default=str)
-            )
+            keys_key = f"rec_keys:{user_id}"
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.setex(
+                    feedback_key, 
+                    86400,  # 24 hours
+                    _dumps(feedback_data)
+                )
+                pipe.smembers(keys_key)
+                _, cache_keys = await pipe.execute()
             
-            # Invalidate user's recommendation cache
-            cache_key = f"recommendations:{user_id}"
-            self.redis_client.delete(cache_key)
+            # Invalidate all of the user's cached recommendations (UNLINK frees
+            # memory in the background instead of blocking Redis)
+            await self.redis_client.unlink(keys_key, *cache_keys)
             
         except Exception as e:
             logger.error(f"Error updating user feedback: {str(e)}")
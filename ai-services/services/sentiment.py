@@ -1,36 +1,119 @@
 # ai-services/services/sentiment.py
 import numpy as np
 import pandas as pd
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 import nltk
-from nltk.tokenize import sent_tokenize, word_tokenize
+from nltk.tokenize import sent_tokenize
 from nltk.corpus import stopwords
 import spacy
+import os
 import re
+import string
+import hashlib
 import logging
+import time
+from collections import Counter
+from functools import lru_cache
 from datetime import datetime
-from typing import Dict, List, Any, Optional, Tuple
+from types import MappingProxyType
+from typing import Dict, List, Any, Mapping, Optional, Tuple
 import asyncio
-import aioredis
-from sqlalchemy import create_engine, text
+import redis.asyncio as redis
+import orjson
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 
 from config.settings import Config
 from utils.preprocessing import preprocess_text, clean_financial_text
 from utils.helpers import cache_result
+from services.batching import BatchingQueue, native_lock, run_in_native_thread
+
+try:
+    import blingfire
+except ImportError:  # blingfire is optional; sentence splitting falls back to NLTK Punkt
+    blingfire = None
+
+try:
+    from optimum.bettertransformer import BetterTransformer
+except ImportError:  # optimum is optional; models keep the stock attention
+    BetterTransformer = None
 
 logger = logging.getLogger(__name__)
 
+# Punctuation (including typographic quotes and dashes) becomes word breaks.
+# The ASCII hyphen is kept so compounds such as 'risk-off' stay one token, as
+# they did under NLTK's word_tokenize
+_WORD_BREAKS = string.punctuation.replace("-", "") + "\u2018\u2019\u201c\u201d\u2013\u2014"
+_PUNCT_TO_SPACE = str.maketrans(_WORD_BREAKS, " " * len(_WORD_BREAKS))
+
+@lru_cache(maxsize=2)
+def _iso_timestamp(seconds: int) -> str:
+    """ISO-8601 local time, formatted once per second"""
+    return datetime.fromtimestamp(seconds).isoformat()
+
+# Counted in Postgres so only one row per sentiment crosses the wire
+MARKET_SENTIMENT_QUERY = text("""
+    SELECT sentiment, COUNT(*) AS article_count
+    FROM news
+    WHERE published_at >= NOW() - CAST(CAST(:timeframe AS TEXT) AS INTERVAL)
+    AND category IN ('market', 'stocks', 'economy')
+    AND sentiment IS NOT NULL
+    GROUP BY sentiment
+""")
+
 class SentimentService:
+    # Most chunks per transformer forward pass
+    PIPELINE_BATCH_SIZE = 32
+    
+    # Texts per spaCy pipe call; a failure is retried per text within one chunk
+    ENTITY_BATCH_SIZE = 64
+    
+    # Class index -> label, in each checkpoint's output order
+    _FINBERT_LABEL_MAP = MappingProxyType({0: 'neutral', 1: 'positive', 2: 'negative'})
+    _GENERAL_LABEL_MAP = MappingProxyType({0: 'negative', 1: 'neutral', 2: 'positive'})
+    
+    # Ensemble weights (FinBERT gets higher weight for financial text); ties
+    # resolve in _SENTIMENTS order
+    _ENSEMBLE_MODELS = ('vader', 'finbert', 'general', 'rule_based')
+    _ENSEMBLE_WEIGHTS = np.array([0.25, 0.4, 0.2, 0.15])
+    _SENTIMENTS = ('positive', 'negative', 'neutral')
+    _SENTIMENT_INDEX = MappingProxyType({'positive': 0, 'negative': 1, 'neutral': 2})
+    
     def __init__(self):
-        self.engine = create_engine(Config.DATABASE_URL)
-        self.redis_client = None
+        self.engine = create_async_engine(
+            make_url(Config.DATABASE_URL).set(drivername="postgresql+asyncpg"),
+            pool_pre_ping=True
+        )
+        # Shared pool; connections are opened lazily on first use
+        self.redis_client = redis.Redis(
+            connection_pool=redis.ConnectionPool.from_url(Config.REDIS_URL, max_connections=32)
+        )
+        
+        # Padded tokens per forward pass; bounds activation memory so short
+        # windows batch wide and long ones narrow
+        self._max_batch_tokens = int(os.getenv("SENTIMENT_MAX_BATCH_TOKENS", 16384))
+        
+        # Batch requests computing cache misses at once; bounds the windows,
+        # probabilities and spaCy docs held in memory by large batches
+        self._batch_semaphore = asyncio.Semaphore(int(os.getenv("SENTIMENT_BATCH_CONCURRENCY", 2)))
+        
         self._init_models()
         self._init_financial_keywords()
         
+        # Fast tokenizers are not safe to call from two threads at once; each
+        # model runs one batch at a time (the two models still overlap). The
+        # batches run on native threads, so these must be OS-level locks
+        self._finbert_lock = native_lock()
+        self._general_lock = native_lock()
+        
+        # Coalesce concurrent requests into one forward pass per model
+        self._finbert_queue = BatchingQueue(self._analyze_with_finbert_batch)
+        self._general_queue = BatchingQueue(self._analyze_with_general_batch)
+        
     async def _get_redis(self):
-        if not self.redis_client:
-            self.redis_client = aioredis.from_url(Config.REDIS_URL)
         return self.redis_client
     
     def _init_models(self):
@@ -39,48 +122,101 @@ class SentimentService:
             # VADER for quick sentiment analysis
             self.vader_analyzer = SentimentIntensityAnalyzer()
             
+            # This runs in the gunicorn master (preload_app), which must never
+            # create a CUDA context: forked workers could not use CUDA at all.
+            # The NVML-based check answers without initializing CUDA, and GPU
+            # placement is deferred to each worker (_ensure_models_on_device).
+            os.environ.setdefault("PYTORCH_NVML_BASED_CUDA_CHECK", "1")
+            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+            self._device_pid = None
+            self._device_lock = native_lock()
+            
             # FinBERT for financial sentiment analysis
-            self.finbert_tokenizer = AutoTokenizer.from_pretrained("yiyanghkust/finbert-tone")
-            self.finbert_model = AutoModelForSequenceClassification.from_pretrained("yiyanghkust/finbert-tone")
-            self.finbert_pipeline = pipeline(
-                "sentiment-analysis",
-                model=self.finbert_model,
-                tokenizer=self.finbert_tokenizer
+            self.finbert_tokenizer = AutoTokenizer.from_pretrained("yiyanghkust/finbert-tone", use_fast=True)
+            self.finbert_model = AutoModelForSequenceClassification.from_pretrained(
+                "yiyanghkust/finbert-tone"
+            ).eval()
+            
+            # General sentiment model
+            self.general_tokenizer = AutoTokenizer.from_pretrained(
+                "cardiffnlp/twitter-roberta-base-sentiment-latest", use_fast=True
             )
-            
-            # General sentiment pipeline
-            self.general_pipeline = pipeline(
-                "sentiment-analysis", 
-                model="cardiffnlp/twitter-roberta-base-sentiment-latest"
+            self.general_model = AutoModelForSequenceClassification.from_pretrained(
+                "cardiffnlp/twitter-roberta-base-sentiment-latest"
+            ).eval()
+            
+            if self.device.type == "cpu":
+                # int8 Linear weights: a quarter of the bytes per GEMM and
+                # VNNI dot products on recent x86. Done here so workers share
+                # the quantized weights copy-on-write
+                self.finbert_model = torch.quantization.quantize_dynamic(
+                    self.finbert_model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+                self.general_model = torch.quantization.quantize_dynamic(
+                    self.general_model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+            
+            # Load spaCy model for NER; only the entity recognizer is used
+            self.nlp = spacy.load(
+                "en_core_web_sm", disable=["tagger", "parser", "attribute_ruler", "lemmatizer"]
             )
             
-            # Load spaCy model for NER
-            self.nlp = spacy.load("en_core_web_sm")
-            
             logger.info("Sentiment analysis models loaded successfully")
             
         except Exception as e:
             logger.error(f"Error loading sentiment models: {str(e)}")
             raise
     
+    def _ensure_models_on_device(self):
+        """Move the models to the GPU once per worker process"""
+        if self.device.type == "cpu" or self._device_pid == os.getpid():
+            return
+        
+        with self._device_lock:
+            if self._device_pid == os.getpid():
+                return
+            
+            # Half precision on GPU (bf16 where supported)
+            dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+            finbert_model = self.finbert_model.to(device=self.device, dtype=dtype)
+            general_model = self.general_model.to(device=self.device, dtype=dtype)
+            
+            if BetterTransformer is not None:
+                # Fused attention kernels; padded tokens are skipped via nested tensors
+                finbert_model = BetterTransformer.transform(finbert_model)
+                general_model = BetterTransformer.transform(general_model)
+            
+            self.finbert_model = finbert_model
+            self.general_model = general_model
+            self._device_pid = os.getpid()
+
     def _init_financial_keywords(self):
         """Initialize financial sentiment keywords"""
-        self.positive_keywords = [
+        self.positive_keywords = frozenset([
             'profit', 'gain', 'growth', 'bull', 'rise', 'increase', 'positive',
             'strong', 'beat', 'exceed', 'outperform', 'surge', 'rally', 'boom',
             'bullish', 'uptrend', 'breakthrough', 'milestone', 'achievement'
-        ]
+        ])
         
-        self.negative_keywords = [
+        self.negative_keywords = frozenset([
             'loss', 'decline', 'bear', 'fall', 'decrease', 'negative', 'weak',
             'miss', 'underperform', 'crash', 'plunge', 'recession', 'bearish',
             'downtrend', 'crisis', 'risk', 'concern', 'worry', 'trouble'
-        ]
+        ])
         
-        self.neutral_keywords = [
+        self.neutral_keywords = frozenset([
             'stable', 'unchanged', 'flat', 'sideways', 'consolidate', 'range',
             'maintain', 'steady', 'consistent', 'regular', 'normal'
-        ]
+        ])
+        
+        # Keyword -> sentiment class, for a single lookup per word
+        self._kw_class = {}
+        for sentiment, keywords in (
+            ('positive', self.positive_keywords),
+            ('negative', self.negative_keywords),
+            ('neutral', self.neutral_keywords)
+        ):
+            self._kw_class.update(dict.fromkeys(keywords, sentiment))
 
     async def analyze_sentiment(
         self, 
@@ -92,50 +228,37 @@ class SentimentService:
         Comprehensive sentiment analysis with multiple models
         """
         try:
-            # Preprocess text
-            processed_text = clean_financial_text(text)
-            
             # Get cached result if available
-            cache_key = f"sentiment:{hash(text)}:{model_type}"
-            redis = await self._get_redis()
-            cached_result = await redis.get(cache_key)
+            cache_key = self._cache_key(text, model_type)
+            redis_client = await self._get_redis()
+            cached_result = await redis_client.get(cache_key)
             
             if cached_result:
-                return eval(cached_result.decode())
+                return orjson.loads(cached_result)
             
-            # Analyze sentiment using multiple approaches
-            results = {}
-            
-            if model_type in ['vader', 'ensemble']:
-                results['vader'] = self._analyze_with_vader(processed_text)
+            # Preprocess text
+            processed_text = clean_financial_text(text)
             
+            # Transformer models run batched across concurrent requests on the
+            # queues' native threads; spaCy runs on another one alongside them
+            jobs = {}
             if model_type in ['finbert', 'ensemble']:
-                results['finbert'] = self._analyze_with_finbert(processed_text)
-            
+                jobs['finbert'] = self._finbert_queue.submit(processed_text)
             if model_type in ['general', 'ensemble']:
-                results['general'] = self._analyze_with_general_model(processed_text)
-            
-            # Rule-based financial sentiment
-            results['rule_based'] = self._analyze_with_rules(processed_text)
+                jobs['general'] = self._general_queue.submit(processed_text)
+            if include_entities:
+                jobs['entities'] = run_in_native_thread(self._extract_entities, text)
             
-            # Ensemble result
-            if model_type == 'ensemble':
-                results['ensemble'] = self._create_ensemble_result(results)
+            outputs = dict(zip(jobs, await asyncio.gather(*jobs.values())))
             
-            # Extract entities if requested
-            if include_entities:
-                results['entities'] = self._extract_entities(text)
-            
-            # Add metadata
-            results['metadata'] = {
-                'text_length': len(text),
-                'processed_length': len(processed_text),
-                'timestamp': datetime.now().isoformat(),
-                'model_type': model_type
-            }
+            results = await run_in_native_thread(
+                self._assemble_results, 
+                text, processed_text, model_type, 
+                outputs.get('finbert'), outputs.get('general'), outputs.get('entities')
+            )
             
             # Cache result for 1 hour
-            await redis.setex(cache_key, 3600, str(results))
+            await redis_client.setex(cache_key, 3600, orjson.dumps(results, option=orjson.OPT_SERIALIZE_NUMPY))
             
             return results
             
@@ -143,6 +266,83 @@ class SentimentService:
             logger.error(f"Error in sentiment analysis: {str(e)}")
             raise
 
+    def _cache_key(self, text: str, model_type: str) -> str:
+        # Stable across processes, unlike the salted built-in hash()
+        text_hash = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+        return f"sentiment:{text_hash}:{model_type}"
+
+    def _assemble_results(
+        self, 
+        text: str, 
+        processed_text: str, 
+        model_type: str, 
+        finbert_result: Optional[Dict[str, Any]], 
+        general_result: Optional[Dict[str, Any]], 
+        entities: Optional[Dict[str, List[Dict[str, Any]]]] = None
+    ) -> Dict[str, Any]:
+        """Combine transformer results with the lightweight analyzers for one text"""
+        results = {}
+        
+        if model_type in ['vader', 'ensemble']:
+            results['vader'] = self._analyze_with_vader(processed_text)
+        
+        if finbert_result is not None:
+            results['finbert'] = finbert_result
+        
+        if general_result is not None:
+            results['general'] = general_result
+        
+        # Rule-based financial sentiment
+        results['rule_based'] = self._analyze_with_rules(processed_text)
+        
+        # Ensemble result
+        if model_type == 'ensemble':
+            results['ensemble'] = self._create_ensemble_result(results)
+        
+        # Attach entities if requested
+        if entities is not None:
+            results['entities'] = entities
+        
+        # Add metadata
+        results['metadata'] = {
+            'text_length': len(text),
+            'processed_length': len(processed_text),
+            'timestamp': _iso_timestamp(int(time.time())),
+            'model_type': model_type
+        }
+        
+        return results
+
+    def _assemble_batch_results(
+        self, 
+        texts: List[str], 
+        processed_texts: List[str], 
+        model_type: str, 
+        finbert_results: List[Optional[Dict[str, Any]]], 
+        general_results: List[Optional[Dict[str, Any]]], 
+        entities: List[Optional[Dict[str, List[Dict[str, Any]]]]]
+    ) -> List[Tuple[Dict[str, Any], bool]]:
+        """Assemble results for a batch; failed texts get a neutral entry flagged as not cacheable"""
+        assembled = []
+        for j, text in enumerate(texts):
+            try:
+                if isinstance(entities[j], Exception):
+                    raise entities[j]
+                result = self._assemble_results(
+                    text, processed_texts[j], model_type, 
+                    finbert_results[j], general_results[j], entities[j]
+                )
+                assembled.append((result, True))
+            except Exception as e:
+                logger.error(f"Error processing text {j}: {str(e)}")
+                assembled.append(({
+                    'sentiment': 'neutral',
+                    'confidence': 0.5,
+                    'error': str(e)
+                }, False))
+        
+        return assembled
+
     def _analyze_with_vader(self, text: str) -> Dict[str, Any]:
         """VADER sentiment analysis"""
         scores = self.vader_analyzer.polarity_scores(text)
@@ -161,84 +361,116 @@ class SentimentService:
             'scores': scores
         }
 
-    def _analyze_with_finbert(self, text: str) -> Dict[str, Any]:
-        """FinBERT financial sentiment analysis"""
+    def _analyze_with_finbert_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """FinBERT financial sentiment analysis for several texts in one batched call"""
         try:
-            # Split long text into chunks
-            chunks = self._split_text(text, max_length=512)
-            chunk_results = []
-            
-            for chunk in chunks:
-                result = self.finbert_pipeline(chunk)[0]
-                chunk_results.append({
-                    'label': result['label'].lower(),
-                    'score': result['score']
-                })
-            
-            # Aggregate results
-            if len(chunk_results) == 1:
-                final_result = chunk_results[0]
-            else:
-                final_result = self._aggregate_chunk_results(chunk_results)
-            
-            return {
-                'sentiment': final_result['label'],
-                'confidence': final_result['score'],
-                'chunks_analyzed': len(chunks)
-            }
-            
+            self._ensure_models_on_device()
+            with self._finbert_lock:
+                return self._run_model_batch(
+                    self.finbert_tokenizer, self.finbert_model, texts, self._FINBERT_LABEL_MAP
+                )
         except Exception as e:
             logger.error(f"FinBERT analysis error: {str(e)}")
-            return {'sentiment': 'neutral', 'confidence': 0.5, 'error': str(e)}
+            return [{'sentiment': 'neutral', 'confidence': 0.5, 'error': str(e)} for _ in texts]
 
-    def _analyze_with_general_model(self, text: str) -> Dict[str, Any]:
-        """General sentiment analysis"""
+    def _analyze_with_general_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """General sentiment analysis for several texts in one batched call"""
         try:
-            chunks = self._split_text(text, max_length=512)
-            chunk_results = []
-            
-            for chunk in chunks:
-                result = self.general_pipeline(chunk)[0]
-                # Map labels to standard format
-                label_mapping = {
-                    'LABEL_0': 'negative',
-                    'LABEL_1': 'neutral', 
-                    'LABEL_2': 'positive',
-                    'NEGATIVE': 'negative',
-                    'NEUTRAL': 'neutral',
-                    'POSITIVE': 'positive'
-                }
-                
-                mapped_label = label_mapping.get(result['label'], result['label'].lower())
-                chunk_results.append({
-                    'label': mapped_label,
-                    'score': result['score']
-                })
+            self._ensure_models_on_device()
+            with self._general_lock:
+                return self._run_model_batch(
+                    self.general_tokenizer, self.general_model, texts, self._GENERAL_LABEL_MAP
+                )
+        except Exception as e:
+            logger.error(f"General model analysis error: {str(e)}")
+            return [{'sentiment': 'neutral', 'confidence': 0.5, 'error': str(e)} for _ in texts]
+
+    @torch.inference_mode()
+    def _model_forward(self, tokenizer, model, windows: List[Tuple[int, ...]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Padded batched forward passes; returns predicted class and probability per window"""
+        input_ids = [tokenizer.build_inputs_with_special_tokens(list(window)) for window in windows]
+        
+        # Batch similar lengths together so little of each batch is padding
+        order = np.argsort([len(ids) for ids in input_ids], kind='stable')
+        sorted_ids = [input_ids[i] for i in order]
+        
+        batch_probs = []
+        start = 0
+        while start < len(sorted_ids):
+            # Grow the batch while (size x longest window) stays within budget;
+            # windows are sorted, so the newest one is always the longest
+            end = start + 1
+            while (
+                end < len(sorted_ids)
+                and end - start < self.PIPELINE_BATCH_SIZE
+                and (end - start + 1) * len(sorted_ids[end]) <= self._max_batch_tokens
+            ):
+                end += 1
+            
+            inputs = tokenizer.pad(
+                {'input_ids': sorted_ids[start:end]},
+                return_tensors="pt"
+            ).to(self.device)
+            logits = model(**inputs).logits
+            batch_probs.append(logits.softmax(-1).float().cpu().numpy())
+            start = end
+        
+        # Undo the length sort
+        probs = np.empty((len(sorted_ids), batch_probs[0].shape[1]), dtype=np.float32)
+        probs[order] = np.concatenate(batch_probs)
+        classes = probs.argmax(axis=1)
+        return classes, probs[np.arange(len(classes)), classes]
+
+    def _run_model_batch(
+        self, 
+        tokenizer, 
+        model, 
+        texts: List[str], 
+        label_map: Mapping[int, str]
+    ) -> List[Dict[str, Any]]:
+        """Run every chunk of every text through a model in batched forward passes"""
+        # Split long texts into token windows and flatten them for a single call
+        text_chunks = self._split_by_tokens(texts, tokenizer)
+        all_chunks = [chunk for chunks in text_chunks for chunk in chunks]
+        
+        # Repeated headlines/sentences only go through the model once
+        unique_index = {chunk: i for i, chunk in enumerate(dict.fromkeys(all_chunks))}
+        inverse = np.fromiter((unique_index[chunk] for chunk in all_chunks), dtype=np.intp, count=len(all_chunks))
+        
+        classes, scores = self._model_forward(tokenizer, model, list(unique_index))
+        classes, scores = classes[inverse], scores[inverse]
+        
+        # Scatter chunk results back to their texts and aggregate
+        results = []
+        offset = 0
+        for chunks in text_chunks:
+            chunk_results = [
+                {'label': label_map[int(label)], 'score': float(score)}
+                for label, score in zip(classes[offset:offset + len(chunks)], scores[offset:offset + len(chunks)])
+            ]
+            offset += len(chunks)
             
-            # Aggregate results
             if len(chunk_results) == 1:
                 final_result = chunk_results[0]
             else:
                 final_result = self._aggregate_chunk_results(chunk_results)
             
-            return {
+            results.append({
                 'sentiment': final_result['label'],
                 'confidence': final_result['score'],
                 'chunks_analyzed': len(chunks)
-            }
-            
-        except Exception as e:
-            logger.error(f"General model analysis error: {str(e)}")
-            return {'sentiment': 'neutral', 'confidence': 0.5, 'error': str(e)}
+            })
+        
+        return results
 
     def _analyze_with_rules(self, text: str) -> Dict[str, Any]:
         """Rule-based sentiment analysis using financial keywords"""
-        text_lower = text.lower()
-        words = word_tokenize(text_lower)
+        words = text.lower().translate(_PUNCT_TO_SPACE).split()
+        counts = Counter(self._kw_class[word] for word in words if word in self._kw_class)
         
-        positive_count = sum(1 for word in words if word in self.positive_keywords)
-        negative_count = sum(1 for word in words if word in words if word in self.negative_keywords)
-        neutral_count = sum(1 for word in words if word in self.neutral_keywords)
+        positive_count = counts['positive']
+        negative_count = counts['negative']
+        neutral_count = counts['neutral']
         
         total_sentiment_words = positive_count + negative_count + neutral_count
         
@@ -278,60 +510,66 @@ class SentimentService:
 
     def _create_ensemble_result(self, results: Dict[str, Any]) -> Dict[str, Any]:
         """Create ensemble result from multiple models"""
-        sentiments = []
-        confidences = []
-        
         # Collect results from different models
-        for model in ['vader', 'finbert', 'general', 'rule_based']:
-            if model in results and 'sentiment' in results[model]:
-                sentiments.append(results[model]['sentiment'])
-                confidences.append(results[model]['confidence'])
+        present = [
+            i for i, model in enumerate(self._ENSEMBLE_MODELS)
+            if 'sentiment' in results.get(model, {})
+        ]
         
-        if not sentiments:
+        if not present:
             return {'sentiment': 'neutral', 'confidence': 0.5}
         
-        # Weight the models (FinBERT gets higher weight for financial text)
-        weights = {
-            'finbert': 0.4,
-            'vader': 0.25,
-            'general': 0.2,
-            'rule_based': 0.15
-        }
-        
-        # Calculate weighted sentiment
-        sentiment_scores = {'positive': 0, 'negative': 0, 'neutral': 0}
-        total_weight = 0
-        
-        for i, model in enumerate(['vader', 'finbert', 'general', 'rule_based']):
-            if model in results:
-                weight = weights.get(model, 0.25)
-                sentiment = results[model]['sentiment']
-                confidence = results[model]['confidence']
-                
-                sentiment_scores[sentiment] += weight * confidence
-                total_weight += weight
+        models = [self._ENSEMBLE_MODELS[i] for i in present]
+        weights = self._ENSEMBLE_WEIGHTS[present]
+        confidences = np.array([results[model]['confidence'] for model in models], dtype=np.float64)
+        indices = np.array([self._SENTIMENT_INDEX[results[model]['sentiment']] for model in models])
         
-        # Normalize scores
-        if total_weight > 0:
-            for sentiment in sentiment_scores:
-                sentiment_scores[sentiment] /= total_weight
+        # Weighted confidence per sentiment, normalized by the weight of the models used
+        total_weight = weights.sum()
+        sentiment_scores = np.bincount(indices, weights=weights * confidences, minlength=3) / total_weight
         
         # Determine final sentiment
-        final_sentiment = max(sentiment_scores, key=sentiment_scores.get)
-        final_confidence = sentiment_scores[final_sentiment]
+        best = int(sentiment_scores.argmax())
         
         return {
-            'sentiment': final_sentiment,
-            'confidence': final_confidence,
-            'scores': sentiment_scores,
+            'sentiment': self._SENTIMENTS[best],
+            'confidence': float(sentiment_scores[best]),
+            'scores': dict(zip(self._SENTIMENTS, sentiment_scores.tolist())),
             'models_used': list(results.keys()),
-            'total_weight': total_weight
+            'total_weight': float(total_weight)
         }
 
-    def _extract_entities(self, text: str) -> Dict[str, List[str]]:
+    def _extract_entities(self, text: str) -> Dict[str, List[Dict[str, Any]]]:
         """Extract named entities from text"""
-        doc = self.nlp(text)
+        return self._doc_entities(self.nlp(text))
+
+    def _extract_entities_batch(self, texts: List[str]) -> List[Any]:
+        """Extract named entities from several texts in spaCy's batched pipe
+        
+        A text whose extraction fails gets its exception in place of the
+        entities, so only that text is reported as an error.
+        """
+        entities = []
+        for start in range(0, len(texts), self.ENTITY_BATCH_SIZE):
+            chunk = texts[start:start + self.ENTITY_BATCH_SIZE]
+            try:
+                chunk_entities = [
+                    self._doc_entities(doc) 
+                    for doc in self.nlp.pipe(chunk, batch_size=self.ENTITY_BATCH_SIZE)
+                ]
+                entities.extend(chunk_entities)
+            except Exception as e:
+                # Retry the chunk one text at a time to isolate the failure
+                logger.error(f"Batched entity extraction failed, retrying per text: {str(e)}")
+                for text in chunk:
+                    try:
+                        entities.append(self._extract_entities(text))
+                    except Exception as text_error:
+                        entities.append(text_error)
         
+        return entities
+
+    def _doc_entities(self, doc) -> Dict[str, List[Dict[str, Any]]]:
         entities = {
             'PERSON': [],
             'ORG': [],
@@ -353,24 +591,56 @@ class SentimentService:
         
         return entities
 
-    def _split_text(self, text: str, max_length: int = 512) -> List[str]:
-        """Split text into chunks for model processing"""
-        sentences = sent_tokenize(text)
-        chunks = []
-        current_chunk = ""
-        
-        for sentence in sentences:
-            if len(current_chunk + sentence) <= max_length:
-                current_chunk += " " + sentence if current_chunk else sentence
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = sentence
+    def _split_sentences(self, text: str) -> List[str]:
+        """Split text into sentences"""
+        if blingfire is not None:
+            return blingfire.text_to_sentences(text).split("\n")
+        return sent_tokenize(text)
+
+    def _split_by_tokens(
+        self, 
+        texts: List[str], 
+        tokenizer, 
+        max_tokens: int = 510
+    ) -> List[List[Tuple[int, ...]]]:
+        """Pack each text's sentences into token-id windows that fit the model"""
+        text_sentences = [self._split_sentences(text) for text in texts]
+        
+        # Tokenize every sentence of every text in one call; later sentences get
+        # their leading space back so BPE ids match tokenizing the whole text
+        encoded = tokenizer(
+            [
+                sentence if i == 0 else " " + sentence
+                for sentences in text_sentences
+                for i, sentence in enumerate(sentences)
+            ],
+            add_special_tokens=False
+        )['input_ids']
         
-        if current_chunk:
-            chunks.append(current_chunk.strip())
+        text_windows = []
+        offset = 0
+        for sentences in text_sentences:
+            windows = []
+            current = []
+            
+            for ids in encoded[offset:offset + len(sentences)]:
+                if current and len(current) + len(ids) > max_tokens:
+                    windows.append(tuple(current))
+                    current = []
+                
+                # A single sentence longer than the window is cut into pieces
+                while len(ids) > max_tokens:
+                    windows.append(tuple(ids[:max_tokens]))
+                    ids = ids[max_tokens:]
+                
+                current.extend(ids)
+            
+            offset += len(sentences)
+            if current or not windows:
+                windows.append(tuple(current))
+            text_windows.append(windows)
         
-        return chunks if chunks else [text[:max_length]]
+        return text_windows
 
     def _aggregate_chunk_results(self, chunk_results: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Aggregate sentiment results from multiple chunks"""
@@ -402,29 +672,61 @@ class SentimentService:
     async def analyze_batch_sentiment(
         self, 
         texts: List[str], 
-        model_type: str = 'ensemble'
+        model_type: str = 'ensemble',
+        include_entities: bool = False
     ) -> List[Dict[str, Any]]:
         """Analyze sentiment for multiple texts"""
+        if not texts:
+            return []
+        
         try:
-            tasks = []
-            for text in texts:
-                task = self.analyze_sentiment(text, model_type=model_type)
-                tasks.append(task)
-            
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Handle exceptions
-            processed_results = []
-            for i, result in enumerate(results):
-                if isinstance(result, Exception):
-                    logger.error(f"Error processing text {i}: {str(result)}")
-                    processed_results.append({
-                        'sentiment': 'neutral',
-                        'confidence': 0.5,
-                        'error': str(result)
-                    })
-                else:
-                    processed_results.append(result)
+            redis_client = await self._get_redis()
+            cache_keys = [self._cache_key(text, model_type) for text in texts]
+            cached_results = await redis_client.mget(cache_keys)
+            
+            processed_results = [
+                orjson.loads(cached) if cached else None for cached in cached_results
+            ]
+            misses = [i for i, result in enumerate(processed_results) if result is None]
+            if not misses:
+                return processed_results
+            
+            miss_texts = [texts[i] for i in misses]
+            
+            async with self._batch_semaphore:
+                processed_texts = [clean_financial_text(text) for text in miss_texts]
+                
+                # One batched pass per transformer model for every uncached text,
+                # each on a native thread (the gevent hub threadpool in production)
+                # so the event loop and the worker's other greenlets keep serving
+                jobs = {}
+                if model_type in ['finbert', 'ensemble']:
+                    jobs['finbert'] = (self._analyze_with_finbert_batch, processed_texts)
+                if model_type in ['general', 'ensemble']:
+                    jobs['general'] = (self._analyze_with_general_batch, processed_texts)
+                if include_entities:
+                    jobs['entities'] = (self._extract_entities_batch, miss_texts)
+                
+                outputs = dict(zip(jobs, await asyncio.gather(
+                    *(run_in_native_thread(fn, batch) for fn, batch in jobs.values())
+                )))
+                
+                empty = [None] * len(misses)
+                assembled = await run_in_native_thread(
+                    self._assemble_batch_results, 
+                    miss_texts, processed_texts, model_type, 
+                    outputs.get('finbert', empty), outputs.get('general', empty), outputs.get('entities', empty)
+                )
+            
+            # Cache every successful result in one round trip
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for i, (result, ok) in zip(misses, assembled):
+                    if ok:
+                        pipe.setex(
+                            cache_keys[i], 3600, orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY)
+                        )
+                    processed_results[i] = result
+                await pipe.execute()
             
             return processed_results
             
@@ -432,37 +734,18 @@ class SentimentService:
             logger.error(f"Error in batch sentiment analysis: {str(e)}")
             raise
 
-    def get_market_sentiment_summary(self, timeframe: str = '1d') -> Dict[str, Any]:
+    async def get_market_sentiment_summary(self, timeframe: str = '1d') -> Dict[str, Any]:
         """Get overall market sentiment summary"""
         try:
-            with self.engine.connect() as conn:
-                # Get recent news articles
-                query = text("""
-                    SELECT title, summary, sentiment, published_at, category
-                    FROM news 
-                    WHERE published_at >= NOW() - INTERVAL :timeframe
-                    AND category IN ('market', 'stocks', 'economy')
-                    ORDER BY published_at DESC
-                """)
-                
-                news_data = conn.execute(query, {"timeframe": timeframe}).fetchall()
+            async with self.engine.connect() as conn:
+                rows = (await conn.execute(MARKET_SENTIMENT_QUERY, {"timeframe": timeframe})).fetchall()
             
-            if not news_data:
-                return {
-                    'overall_sentiment': 'neutral',
-                    'confidence': 0.5,
-                    'articles_analyzed': 0
-                }
-            
-            # Aggregate sentiment scores
-            sentiments = [article.sentiment for article in news_data if article.sentiment]
             sentiment_counts = {'positive': 0, 'negative': 0, 'neutral': 0}
+            for row in rows:
+                if row.sentiment in sentiment_counts:
+                    sentiment_counts[row.sentiment] = row.article_count
             
-            for sentiment in sentiments:
-                if sentiment in sentiment_counts:
-                    sentiment_counts[sentiment] += 1
-            
-            total_articles = len(sentiments)
+            total_articles = sum(row.article_count for row in rows)
             if total_articles == 0:
                 return {
                     'overall_sentiment': 'neutral',
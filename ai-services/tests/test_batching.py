@@ -0,0 +1,121 @@
+import asyncio
+import threading
+
+import pytest
+
+from services.batching import BatchingQueue
+
+def test_concurrent_submits_share_one_batch_in_order():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = BatchingQueue(batch_fn, max_batch=8, max_wait_ms=50)
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+    assert asyncio.run(main()) == [0, 2, 4, 6, 8]
+    assert calls == [[0, 1, 2, 3, 4]]
+
+def test_batches_are_capped_at_max_batch():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(len(items))
+        return items
+
+    batcher = BatchingQueue(batch_fn, max_batch=2, max_wait_ms=50)
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+    assert asyncio.run(main()) == [0, 1, 2, 3, 4]
+    assert max(calls) <= 2
+    assert sum(calls) == 5
+
+def test_batch_fn_exception_fails_every_future_and_worker_survives():
+    def batch_fn(items):
+        if "boom" in items:
+            raise RuntimeError("model failed")
+        return items
+
+    batcher = BatchingQueue(batch_fn, max_batch=8, max_wait_ms=20)
+
+    async def main():
+        failed = await asyncio.gather(
+            batcher.submit("boom"), batcher.submit("ok"), return_exceptions=True
+        )
+        recovered = await batcher.submit("later")
+        return failed, recovered
+
+    failed, recovered = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in failed)
+    assert recovered == "later"
+
+def test_short_results_fail_leftover_futures():
+    batcher = BatchingQueue(lambda items: items[:1], max_batch=8, max_wait_ms=50)
+
+    async def main():
+        return await asyncio.gather(
+            *(batcher.submit(i) for i in range(3)), return_exceptions=True
+        )
+
+    first, *rest = asyncio.run(main())
+    assert first == 0
+    assert rest and all(isinstance(result, ValueError) for result in rest)
+
+def test_cancelled_submits_are_not_sent_to_batch_fn():
+    release = threading.Event()
+    seen = []
+
+    def batch_fn(items):
+        seen.extend(items)
+        release.wait(1)
+        return items
+
+    batcher = BatchingQueue(batch_fn, max_batch=1, max_wait_ms=1)
+
+    async def main():
+        # The first item occupies the worker while the second is cancelled
+        first = batcher.submit("first")
+        await asyncio.sleep(0.05)
+        second = batcher.submit("second")
+        second.cancel()
+        # Cancellation reaches the queued future on the loop's next iteration
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.sleep(0.05)
+        return await first, await batcher.submit("third")
+
+    assert asyncio.run(main()) == ("first", "third")
+    assert "second" not in seen
+
+def test_dead_worker_is_replaced_without_losing_queued_items():
+    batcher = BatchingQueue(lambda items: items, max_batch=8, max_wait_ms=1)
+
+    async def main():
+        assert await batcher.submit(1) == 1
+
+        # Simulate a worker that died with an item still queued
+        queue_before = batcher._queue
+        batcher._worker = threading.Thread(target=lambda: None)
+        batcher._worker.start()
+        batcher._worker.join()
+
+        result = await asyncio.wait_for(batcher.submit(2), timeout=1)
+        assert batcher._queue is queue_before
+        return result
+
+    assert asyncio.run(main()) == 2
+
+@pytest.mark.parametrize("max_batch", [1, 4])
+def test_results_match_inputs_under_load(max_batch):
+    batcher = BatchingQueue(lambda items: [-item for item in items], max_batch=max_batch, max_wait_ms=2)
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(50)))
+
+    assert asyncio.run(main()) == [-i for i in range(50)]
@@ -0,0 +1,133 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from services.recommendation import (
+    MISSING_ELAPSED,
+    _elapsed,
+    _score_courses_kernel,
+    _score_courses_vectorized,
+    score_courses,
+)
+
+def reference_course_score(
+    is_preferred, course_level, rating, review_count, days_old, language_match, user_level
+):
+    """Row-at-a-time rules of the original RecommendationService._calculate_course_score"""
+    score = 0.0
+
+    if is_preferred:
+        score += 0.3
+
+    if course_level == user_level:
+        score += 0.25
+    elif course_level == user_level + 1:
+        score += 0.15
+    elif course_level == user_level - 1:
+        score += 0.1
+
+    score += (rating / 5.0) * 0.2
+    score += min(review_count / 100.0, 0.1)
+
+    if days_old is not None:
+        if days_old < 30:
+            score += 0.1
+        elif days_old < 90:
+            score += 0.05
+
+    if language_match:
+        score += 0.1
+
+    return min(score, 1.0)
+
+# (is_preferred, course_level, rating, review_count, days_old, language_match)
+ROWS = [
+    # Level: same, +1, -1, +2, -2 relative to an intermediate (2) user
+    (False, 2, 0.0, 0, None, False),
+    (False, 3, 0.0, 0, None, False),
+    (False, 1, 0.0, 0, None, False),
+    (False, 4, 0.0, 0, None, False),
+    (False, 0, 0.0, 0, None, False),
+    # Recency boundaries; -1 is a creation date slightly in the future
+    (False, 1, 3.0, 5, -1, False),
+    (False, 1, 3.0, 5, 0, False),
+    (False, 1, 3.0, 5, 29, False),
+    (False, 1, 3.0, 5, 30, False),
+    (False, 1, 3.0, 5, 89, False),
+    (False, 1, 3.0, 5, 90, False),
+    (False, 1, 3.0, 5, None, False),
+    # Popularity cap and fractional ratings
+    (False, 2, 4.3, 7, 45, True),
+    (False, 2, 2.5, 10, 200, False),
+    (True, 3, 1.0, 500, None, True),
+    # Every bonus at once exceeds 1.0 and is clamped
+    (True, 2, 5.0, 1000, 0, True),
+    (True, 2, 5.0, 10, 29, True),
+]
+
+USER_LEVEL = 2
+
+def _columns(rows):
+    is_preferred, level, rating, review_count, days_old, language_match = zip(*rows)
+    return (
+        np.array(is_preferred, dtype=np.bool_),
+        np.array(level, dtype=np.int8),
+        np.array(rating, dtype=np.float32),
+        np.array(review_count, dtype=np.float32),
+        np.array([MISSING_ELAPSED if d is None else d for d in days_old], dtype=np.int32),
+        np.array(language_match, dtype=np.bool_),
+        USER_LEVEL,
+    )
+
+def _expected(rows):
+    return np.array([reference_course_score(*row, USER_LEVEL) for row in rows])
+
+def _implementations():
+    implementations = [
+        pytest.param(_score_courses_kernel, id="python-kernel"),
+        pytest.param(_score_courses_vectorized, id="numpy"),
+        pytest.param(score_courses, id="selected"),
+    ]
+    try:
+        from numba import njit
+    except ImportError:
+        pass
+    else:
+        implementations.append(
+            pytest.param(njit(fastmath=True)(_score_courses_kernel), id="numba")
+        )
+    return implementations
+
+@pytest.mark.parametrize("score_fn", _implementations())
+def test_scores_match_original_rules(score_fn):
+    scores = score_fn(*_columns(ROWS))
+
+    assert scores.shape == (len(ROWS),)
+    np.testing.assert_allclose(scores, _expected(ROWS), atol=1e-6)
+
+def test_numba_and_numpy_paths_agree():
+    numba = pytest.importorskip("numba")
+    columns = _columns(ROWS)
+
+    np.testing.assert_allclose(
+        numba.njit(fastmath=True)(_score_courses_kernel)(*columns),
+        _score_courses_vectorized(*columns),
+        atol=1e-6,
+    )
+
+def test_clamped_to_one():
+    scores = _score_courses_vectorized(*_columns(ROWS[-2:]))
+    assert np.all(scores == np.float32(1.0))
+
+def test_elapsed_floors_and_marks_missing():
+    now = np.datetime64("2024-03-31T12:00:00")
+    timestamps = [
+        datetime(2024, 3, 31, 13, 0),   # an hour in the future
+        datetime(2024, 3, 1, 12, 0),    # exactly 30 days
+        datetime(2024, 3, 1, 12, 0, 1), # one second short of 30 days
+        None,
+    ]
+
+    assert _elapsed(timestamps, now, "D").tolist() == [-1, 30, 29, MISSING_ELAPSED]
+    assert _elapsed(timestamps[:1], now, "h").tolist() == [-1]
@@ -0,0 +1,30 @@
+import pytest
+
+from services.sentiment import SentimentService
+
+@pytest.fixture(scope="module")
+def service():
+    # Only the keyword tables are needed; skip loading the models
+    service = SentimentService.__new__(SentimentService)
+    service._init_financial_keywords()
+    return service
+
+def keyword_counts(service, text):
+    return service._analyze_with_rules(text).get('keyword_counts', {})
+
+def test_hyphenated_compounds_stay_one_token(service):
+    # 'risk-off' and 'risk-on' are not keywords, so 'risk' is not counted
+    assert keyword_counts(service, "Markets turn risk-off, then risk-on") == {}
+
+def test_punctuation_and_typographic_quotes_break_words(service):
+    counts = keyword_counts(service, "Strong “growth”; profit—loss. Tesla's (rally)!")
+    assert counts == {'positive': 4, 'negative': 1, 'neutral': 0}
+
+def test_spaced_dashes_do_not_hide_keywords(service):
+    counts = keyword_counts(service, "Gain - then decline -- then steady")
+    assert counts == {'positive': 1, 'negative': 1, 'neutral': 1}
+
+def test_matching_is_case_insensitive(service):
+    result = service._analyze_with_rules("BULLISH Surge")
+    assert result['sentiment'] == 'positive'
+    assert result['keyword_counts']['positive'] == 2
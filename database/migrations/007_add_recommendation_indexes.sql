@@ -0,0 +1,13 @@
+-- database/migrations/007_add_recommendation_indexes.sql
+-- Indexes for the per-course learning aggregates used by the AI recommendation service
+
+-- Assessment scores are looked up per (user, assessment) and assessments per course
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_assessment_results_user_assessment
+ON assessment_results(user_id, assessment_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_assessments_course
+ON assessments(course_id);
+
+-- Lesson progress is summed per course through lessons
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_lessons_course
+ON lessons(course_id);